@@ -1,29 +1,135 @@
-import argparse
 import sys
-import os
+from types import SimpleNamespace
 
 # TODO: seperate module using command like fetch, download and clean
 
-def get_cli_input():
+USAGE = """usage: cwbd {clean,status,run,fetch,download} [options]
+
+Commons Wikimedia Bulk Donwloader (SQL dump based)
+
+commands:
+  clean       Remove generated folders and files used during fetch or download phase.
+  status      Print some status information about the state of the different phases.
+  run         Fetch and download media files.
+  fetch       Scan SQL dumps and build media index
+  download    Download media files from previously fetched index
+
+Run 'cwbd <command> --help' for the options of a command.
+"""
+
+# option flag -> (namespace attribute, cast), flags without a cast are boolean switches
+OPTIONS = {
+  "--category-file"    : ("category_file", str),
+  "-c"                 : ("category_file", str),
+  "--dumps-dir"        : ("dumps_dir", str),
+  "-d"                 : ("dumps_dir", str),
+  "--output-dir"       : ("output_dir", str),
+  "-o"                 : ("output_dir", str),
+  "--workers"          : ("workers", int),
+  "-w"                 : ("workers", int),
+  "--recursive-search" : ("recursive_search", None),
+}
+
+# command -> (required options, optional options)
+COMMANDS = {
+  "clean"    : ((), ()),
+  "status"   : ((), ()),
+  "run"      : (("category_file", "dumps_dir", "output_dir"), ("workers", "recursive_search")),
+  "fetch"    : (("category_file", "dumps_dir"), ("recursive_search",)),
+  "download" : (("category_file", "output_dir"), ("workers", "recursive_search")),
+}
+
+def get_cli_input(argv : list[str] = None):
   """
   Parse and validate command-line arguments for the Wikimedia Commons image Downloader.
-  
+
   Args:
-      None
-  
+      argv (list[str]): Command line arguments, defaults to sys.argv[1:].
+
   Return:
-      argparse.Namespace:
+      SimpleNamespace:
           Parsed command line arguments containing:
+            - command (str): The invoked command.
             - category_file (str): Path to file listing target Wikimedia Commons categories.
             - dumps_dir (str): Directory containing Wikimedia Commons SQL dump files.
             - output_dir (str): Directory where downloaded images will be stored.
             - workers (int): Number of parallel download threads.
-            - no_recursive_search (bool): Wether to disable recursive subcategory traversal.
-  
+            - recursive_search (bool): Wether to enable recursive subcategory traversal.
+
   Notes:
-      - The function terminates the program if required files or directories do not exist.
+      - The function terminates the program on missing or invalid arguments.
+      - Paths are not checked here, the category file and dump files are validated when they are used.
       - This function should be called once at program startup
+      - argparse is only loaded to render help output for '--help'/'-h'.
+  """
+  argv = sys.argv[1:] if argv is None else argv
+
+  if '--help' in argv or '-h' in argv:
+    _build_parser(argv[0]).parse_args(argv)
+    sys.exit(0)
+
+  if not argv or argv[0] not in COMMANDS:
+    sys.stdout.write(USAGE)
+    sys.exit(1)
+
+  command, *options = argv
+  required, optional = COMMANDS[command]
+  args = SimpleNamespace(
+    command=command,
+    category_file=None,
+    dumps_dir=None,
+    output_dir=None,
+    workers=10,
+    recursive_search=False,
+  )
+
+  it = iter(options)
+  for opt in it:
+    flag, eq, value = opt.partition('=')
+    if flag not in OPTIONS and opt[1:2] != '-' and opt[:2] in OPTIONS:
+      # short option with its value attached, like argparse accepts '-w5' or '-cPATH'
+      flag, eq, value = opt[:2], '=', opt[2:]
+
+    if flag not in OPTIONS or OPTIONS[flag][0] not in required + optional:
+      _usage_error(command, f'unrecognized argument: {opt}')
+
+    dest, cast = OPTIONS[flag]
+    if cast is None:
+      if eq:
+        _usage_error(command, f'argument {flag}: ignored explicit argument \'{value}\'')
+      setattr(args, dest, True)
+      continue
+
+    if not eq and (value := next(it, None)) is None:
+      _usage_error(command, f'argument {flag}: expected one argument')
+
+    try:
+      setattr(args, dest, cast(value))
+    except ValueError:
+      _usage_error(command, f'argument {flag}: invalid {cast.__name__} value: \'{value}\'')
+
+  if (missing := [dest for dest in required if getattr(args, dest) is None]):
+    flags = ', '.join(next(f for f, (d, _) in OPTIONS.items() if d == dest) for dest in missing)
+    _usage_error(command, f'the following arguments are required: {flags}')
+
+  return args
+
+def _usage_error(command : str, message : str):
+  print(f'usage: cwbd {command} [options]\ncwbd {command}: error: {message}', file=sys.stderr)
+  sys.exit(2)
+
+def _build_parser(command : str = None):
+  """
+  Build the argparse parser, only used to render '--help' output.
+
+  Args:
+      command (str): The invoked command, only its subparser is built.
+                     All subparsers are built if the command is unknown.
   """
+  import argparse
+
+  wanted = (command,) if command in COMMANDS else tuple(COMMANDS)
+
   parser = argparse.ArgumentParser(
     prog="cwbd",
     description="Commons Wikimedia Bulk Donwloader (SQL dump based)"
@@ -36,69 +142,58 @@ def get_cli_input():
   # -------------------------------------------------------------------
   # Clean
   # -------------------------------------------------------------------
-  subparsers.add_parser(
-    "clean",
-    help="Remove generated folders and files used during fetch or download phase."
-  )
+  if "clean" in wanted:
+    subparsers.add_parser(
+      "clean",
+      help="Remove generated folders and files used during fetch or download phase."
+    )
 
-  subparsers.add_parser(
-    "status",
-    help="Print some status information about the state of the different phases."
-  )
+  if "status" in wanted:
+    subparsers.add_parser(
+      "status",
+      help="Print some status information about the state of the different phases."
+    )
 
   # -------------------------------------------------------------------
   # Run
   # -------------------------------------------------------------------
-  run = subparsers.add_parser(
-    "run",
-    help="Fetch and download media files."
-  )
+  if "run" in wanted:
+    run = subparsers.add_parser(
+      "run",
+      help="Fetch and download media files."
+    )
 
-  run.add_argument("--category-file", "-c", type=str, required=True, help="File with categories")
-  run.add_argument("--dumps-dir", "-d", type=str, required=True, help="Directory with SQL dumps")
-  run.add_argument("--output-dir", "-o", type=str, required=True, help="Download directory")
-  run.add_argument("--workers", "-w", type=int, default=10, help="Number of parallel downloads")
-  run.add_argument("--recursive-search", action='store_true', help="Recursively scan subcategories")
+    run.add_argument("--category-file", "-c", type=str, required=True, help="File with categories")
+    run.add_argument("--dumps-dir", "-d", type=str, required=True, help="Directory with SQL dumps")
+    run.add_argument("--output-dir", "-o", type=str, required=True, help="Download directory")
+    run.add_argument("--workers", "-w", type=int, default=10, help="Number of parallel downloads")
+    run.add_argument("--recursive-search", action='store_true', help="Recursively scan subcategories")
 
   # -------------------------------------------------------------------
   # Fetch
   # -------------------------------------------------------------------
-  fetch = subparsers.add_parser(
-    "fetch", 
-    help="Scan SQL dumps and build media index"
-  )
+  if "fetch" in wanted:
+    fetch = subparsers.add_parser(
+      "fetch",
+      help="Scan SQL dumps and build media index"
+    )
 
-  fetch.add_argument("--category-file","-c", type=str,  required=True, help="File that holds the desired categories" )
-  fetch.add_argument("--dumps-dir",    "-d", type=str,  required=True, help="Directory containing Commons SQL dump files")
-  fetch.add_argument("--recursive-search", action='store_true', help="Prevent program to recursively obtain all media files in subcategories")
+    fetch.add_argument("--category-file","-c", type=str,  required=True, help="File that holds the desired categories" )
+    fetch.add_argument("--dumps-dir",    "-d", type=str,  required=True, help="Directory containing Commons SQL dump files")
+    fetch.add_argument("--recursive-search", action='store_true', help="Prevent program to recursively obtain all media files in subcategories")
 
   # -------------------------------------------------------------------
   # Download
   # -------------------------------------------------------------------
-  download = subparsers.add_parser(
-    "download",
-    help="Download media files from previously fetched index"
-  )
+  if "download" in wanted:
+    download = subparsers.add_parser(
+      "download",
+      help="Download media files from previously fetched index"
+    )
 
-  download.add_argument("--category-file","-c", type=str,  required=True, help="File that holds the desired categories" )
-  download.add_argument("--output-dir",   "-o", type=str,  required=True, help="Directory to store downloaded images")
-  download.add_argument("--workers",      "-w", type=int,  default=10,    help="Number of parallel download threads")
-  download.add_argument("--recursive-search", action='store_true', help="Prevent program to recursively obtain all media files in subcategories")
-  
-  args = parser.parse_args()
-
-  if args.command is None or args.command not in ("clean", "fetch", "download", "run", "status"):
-    parser.print_help()
-    sys.exit(1)
+    download.add_argument("--category-file","-c", type=str,  required=True, help="File that holds the desired categories" )
+    download.add_argument("--output-dir",   "-o", type=str,  required=True, help="Directory to store downloaded images")
+    download.add_argument("--workers",      "-w", type=int,  default=10,    help="Number of parallel download threads")
+    download.add_argument("--recursive-search", action='store_true', help="Prevent program to recursively obtain all media files in subcategories")
 
-  if args.command in ("fetch", "download", "run"):
-    if not os.path.isfile(args.category_file):
-      print(f'[ERROR] File does not exist: {args.category_file}', file=sys.stderr)
-      sys.exit(1)
-
-  if args.command == ("fetch", "run"):
-    if not os.path.isdir(args.dumps_dir):
-      print(f'[ERROR] Directory does not exist: {args.dumps_dir}', file=sys.stderr)
-      sys.exit(1)
-  
-  return args
\ No newline at end of file
+  return parser
@@ -1,9 +1,9 @@
 from dataclasses import dataclass, field
 from pathlib import Path
 
-from .cwbd_utils import get_json_data
+from .cwbd_utils import get_json_data, compact_positions, dump_table_name
 
-@dataclass
+@dataclass(slots=True)
 class ProgramContext:
   """
   Central runtime context holding configuration, paths and state shared across all program phases.
@@ -27,17 +27,19 @@ class ProgramContext:
   checkpoint_dir : Path = field(init=False)
   progress_scanner : Path = field(init=False)
 
-  program_set : set = field(default_factory=set)
+  program_set : frozenset = frozenset()
   _input_categories : set = field(default_factory=set)
   process_categories : set = field(default_factory=set)
   
   pfiles : dict =  field(default_factory=dict)
 
   save_interval : int = 200
+  flush_interval : float = 5.0
+  chunk_size : int = 256 * 1024
   _max_workers : int = field(default_factory=int)
 
   _recursive_search : bool = field(default_factory=bool)
-  max_phase_matches = 0
+  max_phase_matches : int = 0
 
   found_files : Path = field(init=False)
   invalid_files : Path = field(init=False)
@@ -78,18 +80,23 @@ class ProgramContext:
       _max_workers=max_workers,
     )
 
+    # only the phases that write the journal compact it, status and clean leave it untouched
+    compact_positions(ctx.progress_scanner)
     ctx._init_dump_files()
     return ctx
   
   @classmethod
   def init_download(cls, *, output_dir : Path, input_categories : set[str], max_workers : int, recursive_search : bool):
-    return ProgramContext(
+    ctx = ProgramContext(
       _output_dir=output_dir,
       _input_categories=input_categories,
       _max_workers=max_workers,
       _recursive_search=recursive_search,
      )
 
+    compact_positions(ctx.progress_scanner)
+    return ctx
+
   @classmethod
   def init_fetch(cls, *, dumps_dir : Path, input_categories : set[str], recursive_search : bool):
     ctx = cls(
@@ -98,6 +105,7 @@ class ProgramContext:
       _recursive_search=recursive_search
      )
 
+    compact_positions(ctx.progress_scanner)
     ctx._init_dump_files()
     return ctx
 
@@ -120,16 +128,15 @@ class ProgramContext:
     Notes:
         - Each dump file is mapped to a corresponding scan output file.
         - Output files are stored inside the checkpoint directory.
-        - Abort initialization if any of the required dump files is missing.
+        - Exits the program listing all missing dump files if any of them is missing.
     """
-    for path in (self.linktarget_dump, self.category_dump, self.page_dump):
-      if not path.is_file():
-        print(f'[ERROR] Missing Required file {path}')
-        return None
-      else:
-        base =  Path(path).name.split('.')[0]
-        outfile = f'{base[base.rfind("-") +1:]}_scan_output.txt'
-        self.pfiles[path] = self.checkpoint_dir / outfile
+    dumps = (self.linktarget_dump, self.category_dump, self.page_dump)
+    if (missing := [path for path in dumps if not path.is_file()]):
+      raise SystemExit('\n'.join(f'[ERROR] Missing Required file {path}' for path in missing))
+
+    for path in dumps:
+      outfile = f'{dump_table_name(path)}_scan_output.txt'
+      self.pfiles[path] = self.checkpoint_dir / outfile
   
   def reset_scanner(self):
     """"
@@ -141,23 +148,27 @@ class ProgramContext:
         - Existing scan output files are deleted when a reset occurs.
     """
     # reset on new category search, keep on resuming previous category input
-    with open(self.progress_scanner, 'a+', encoding='utf-8') as f:
-      # since we open in 'a+' we need to reset the pointer to check the first line
-      f.seek(0)
-      first_line = f.readline().rstrip('\n')
-      existing = set(x.strip() for x in first_line.split(',')) if first_line else set()
-      
-      found_cats = get_json_data(self.found_files)
-      if not self._input_categories.issubset(existing) and not all(cat in found_cats for cat in self._input_categories):
-        f.truncate(0)
-        f.write(",".join(sorted(self._input_categories))+'\n')
-
-        try:
-          self.program_files[self.linktarget_dump].unlink()
-          self.program_files[self.category_dump].unlink()
-          self.program_files[self.page_dump].unlink()
-        except:
-          pass
+    try:
+      with open(self.progress_scanner, 'r', encoding='utf-8') as f:
+        first_line = f.readline().rstrip('\n')
+    except FileNotFoundError:
+      first_line = ''
+    existing = set(x.strip() for x in first_line.split(',')) if first_line else set()
+
+    # resuming with the same categories is the common case, only load the
+    # (potentially large) found files index when the signature does not cover the input
+    if self._input_categories.issubset(existing):
+      return
+
+    found_cats = get_json_data(self.found_files)
+    if all(cat in found_cats for cat in self._input_categories):
+      return
+
+    with open(self.progress_scanner, 'w', encoding='utf-8') as f:
+      f.write(",".join(sorted(self._input_categories))+'\n')
+
+    for outfile in self.pfiles.values():
+      outfile.unlink(missing_ok=True)
 
   @property
   def program_files(self):
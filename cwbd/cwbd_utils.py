@@ -1,6 +1,13 @@
 import os
 import json
 import mmap
+import tempfile
+from bisect import bisect_right
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
 
 class WikiNamespace():
   """
@@ -27,25 +34,240 @@ class WikiNamespace():
 def fformat(*parameters, sep : str ='\t', newline : bool = False):
   return sep.join("" if p is None else str(p) for p in parameters) + ('\n' if newline else '')
 
+def dump_table_name(infile : str):
+  """
+  Get the table name of a SQL dump from its file name.
+
+  Args:
+      infile (str): Path to a dump, e.g. 'dumps/commonswiki-20240101-categorylinks.sql.gz'.
+
+  Return:
+      str: The table name, e.g. 'categorylinks'.
+  """
+  return os.path.basename(infile).partition('.')[0].rpartition('-')[2]
+
 def normalize_cat_input(raw_cats : list[str]):
   return { normalize(item) for item in raw_cats}
 
 def normalize(s : str):
   return s.strip().replace(' ',  '_')
 
+def prefix_matcher(prefixes : set[str]):
+  """
+  Build a test that checks wether a string starts with any of the given prefixes.
+
+  Args:
+      prefixes (set[str]): The prefixes to match against.
+
+  Return:
+      Callable[[str], bool]: Returns True if the string starts with one of the prefixes.
+
+  Notes:
+      - Prefixes that start with a shorter prefix are dropped, the closest prefix sorting 
+        before the string is then the only one that can match (O(log n) per lookup).
+  """
+  ordered = []
+  for prefix in sorted(prefixes):
+    if not ordered or not prefix.startswith(ordered[-1]):
+      ordered.append(prefix)
+
+  def matches(s : str):
+    i = bisect_right(ordered, s)
+    return i > 0 and s.startswith(ordered[i - 1])
+  return matches
+
+def read_json_data(infile : str):
+  """
+  Read a JSON file.
+
+  Args:
+      infile (str): Path to the JSON file.
+
+  Return:
+      The decoded data.
+
+  Notes:
+      - Uses orjson when it is installed, falls back to the standard json module otherwise.
+      - Unlike get_json_data, missing or malformed files raise.
+  """
+  if orjson:
+    with open(infile, 'rb') as f:
+      return orjson.loads(f.read())
+
+  with open(infile, 'r', encoding='utf-8') as f:
+    return json.load(f)
+
 # check file wether some categories have been processed before.
 def get_json_data(infile : str):
   if not os.path.exists(infile):
     return {}
   
   try:
-    with open(infile, 'r', encoding='utf-8') as f:
-      return json.load(f)
+    return read_json_data(infile)
   except (json.JSONDecodeError, OSError, ValueError) as e:
     print(f'Failed to read processed categories from {infile} : {e}!')
     return {}
+
+def write_json_data(outfile : str, data : dict):
+  """
+  Write data to a JSON file, indented and UTF-8 encoded.
+
+  Args:
+      outfile (str): Path to the JSON file.
+      data (dict): The data to store.
+
+  Return:
+      None
+
+  Notes:
+      - Uses orjson when it is installed, falls back to the standard json module otherwise.
+  """
+  if orjson:
+    atomic_write(outfile, orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))
+    return
+
+  atomic_write(outfile, json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8'))
+
+# the process umask can only be read by setting it, do so once at import
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def atomic_write(outfile : str, data : bytes):
+  """
+  Replace the contents of a file in a single step.
+
+  Args:
+      outfile (str): Path to the file to (over)write.
+      data (bytes): The new contents.
+
+  Return:
+      None
+
+  Notes:
+      - Data is written and fsynced to a temporary file in the same directory, which then
+        replaces outfile, a crash leaves either the old or the new file but never a partial one.
+      - The temporary file is created 0600, it gets the mode of the file it replaces (or the
+        umask default for a new file) so the result has the same permissions as a plain open().
+  """
+  try:
+    mode = os.stat(outfile).st_mode & 0o777
+  except FileNotFoundError:
+    mode = 0o666 & ~_UMASK
+
+  tmp = tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(os.path.abspath(outfile)), prefix='.tmp-', delete=False)
+  try:
+    with tmp:
+      tmp.write(data)
+      tmp.flush()
+      os.fsync(tmp.fileno())
+    os.chmod(tmp.name, mode)
+    os.replace(tmp.name, outfile)
+  except BaseException:
+    os.unlink(tmp.name)
+    raise
+
+def load_found_files(infile : str, count : bool = True):
+  """
+  Open the found files index for a single pass over its categories.
+
+  Args:
+      infile (str): Path to the JSON file mapping categories to their files.
+      count (bool): Wether to count the categories and files of the index.
+
+  Return:
+      tuple[int, int, Iterable]: The number of categories, the total number of files and
+                                 an iterable yielding (category, meta) pairs.
+
+  Notes:
+      - With ijson installed the index is streamed, only one category is held in memory at a time.
+      - Counting takes an extra pass over the streamed index, with count=False both numbers are 0.
+      - Without ijson the whole index is loaded through get_json_data.
+  """
+  try:
+    import ijson
+  except ImportError:
+    data = get_json_data(infile)
+    return len(data), sum(int(meta['n_files']) for meta in data.values()), data.items()
+
+  if not os.path.exists(infile):
+    return 0, 0, ()
+
+  def stream():
+    with open(infile, 'rb') as f:
+      yield from ijson.kvitems(f, '')
+
+  if not count:
+    return 0, 0, stream()
+
+  n_categories = n_files = 0
+  try:
+    with open(infile, 'rb') as f:
+      for prefix, event, value in ijson.parse(f):
+        if event == 'map_key' and not prefix:
+          n_categories += 1
+        elif event == 'number' and prefix.endswith('.n_files'):
+          n_files += int(value)
+  except (ijson.JSONError, OSError) as e:
+    print(f'Failed to read processed categories from {infile} : {e}!')
+    return 0, 0, ()
+
+  return n_categories, n_files, stream()
   
 
+def append_lines(outfile : str, lines : list[str]):
+  """
+  Append entries to a text file, one entry per line.
+
+  Args:
+      outfile (str): Path to the file to append to, created if it does not exist.
+      lines (list[str]): Entries to append.
+
+  Return:
+      None
+
+  Notes:
+      - A missing trailing newline (files written by older versions) is added first.
+  """
+  if not lines:
+    return
+
+  with open(outfile, 'ab+') as f:
+    if f.seek(0, os.SEEK_END):
+      f.seek(-1, os.SEEK_END)
+      if f.read(1) != b'\n':
+        f.write(b'\n')
+    f.write(''.join(fformat(line, newline=True) for line in lines).encode('utf-8'))
+
+def read_positions(scanner_file : str):
+  """
+  Replay the progress journal into the signature line and the latest position per key.
+
+  Args:
+      scanner_file (str): Path to the progress/save file.
+
+  Return:
+      tuple[str, dict[str, int]]: The signature line and a mapping of progress keys to positions.
+
+  Notes:
+      - Later entries override earlier ones for the same key.
+      - Malformed lines (e.g. a write cut short by a crash) are skipped.
+  """
+  signature = ""
+  positions = {}
+  try:
+    with open(scanner_file, 'r', encoding='utf-8') as f:
+      signature = f.readline()
+
+      for line in f:
+        key, sep, value = line.partition('=')
+        try:
+          positions[key.strip()] = int(value)
+        except ValueError:
+          continue
+  except FileNotFoundError:
+    pass
+  return signature, positions
+
 def load_position(scanner_file : str, dump_file : str):
   """
   Read the last saved line position for a given dump file configuration.
@@ -57,18 +279,7 @@ def load_position(scanner_file : str, dump_file : str):
   Return:
       int: The stored line number or 0 if not found
   """
-  try:
-    with open(scanner_file, 'r') as f:
-      # skip signature
-      next(f, None)
-      for line in f:
-        key, value = line.split('=', 1)
-        if key.strip() == dump_file:
-          return int(value.strip())
-  except Exception as e:
-    print(e)
-    return 0
-  return 0
+  return read_positions(scanner_file)[1].get(dump_file, 0)
 
 def save_position(scanner_file : str, dump_file : str, position: int):
   """  
@@ -84,25 +295,33 @@ def save_position(scanner_file : str, dump_file : str, position: int):
 
   Notes:
       - Stores all keys in simple '{key}=value' pairs.
-      - preserves old entries while updting the specified one.
+      - The file is an append-only journal, the latest entry of a key is its current value.
+      - An empty signature line is written first when the file does not exist yet.
   """
-  signature = ""
-  positions = {}
-  if os.path.exists(scanner_file):
-    with open(scanner_file, 'r') as f:
-      
-      signature = f.readline()
+  with open(scanner_file, 'a', encoding='utf-8') as f:
+    if not f.tell():
+      f.write('\n')
+    f.write(fformat(dump_file, position, sep='=', newline=True))
 
-      for line in f:
-        key, value = line.split('=', 1)
-        positions[key.strip()] = int(value.strip())
-  
-  positions[dump_file] = position
+def compact_positions(scanner_file : str):
+  """
+  Rewrite the progress journal keeping only the latest position per key.
+
+  Args:
+      scanner_file (str): Path to the progress/save file.
+
+  Return:
+      None
+
+  Notes:
+      - The journal is replaced atomically, an interrupted compaction keeps the old journal.
+  """
+  if not os.path.exists(scanner_file):
+    return
 
-  with open(scanner_file, 'w') as f:
-    f.write(signature)
-    for key, value in positions.items():
-      f.write(fformat(key, value, sep='=', newline=True))
+  signature, positions = read_positions(scanner_file)
+  lines = ''.join(fformat(key, value, sep='=', newline=True) for key, value in positions.items())
+  atomic_write(scanner_file, (signature + lines).encode('utf-8'))
 
 def get_id_set(input_file : str):
   """
@@ -112,9 +331,14 @@ def get_id_set(input_file : str):
       input_file (str): Path to the file formatted as '{id}\t{title}.
 
   Return:
-      set[int]: All IDs found in the file.
+      frozenset[int]: All IDs found in the file.
+
+  Notes:
+      - Only the id column is parsed, lines not starting with a digit are skipped.
+      - Returned frozen, the set is never changed after loading and only probed by the scan handlers.
   """
-  return get_set(input_file, 0)
+  with open(input_file, 'rb') as f:
+    return frozenset(int(line.partition(b'\t')[0]) for line in f if line[:1].isdigit())
 
 def get_title_set(input_file : str):
   """
@@ -124,48 +348,36 @@ def get_title_set(input_file : str):
       input_file (str): Path to the file formatted as '{id}\t{title}.
 
   Return:
-      set[str]: All titles found in the file.
+      frozenset[str]: All titles found in the file.
 
   Notes:
       - newlines are trimmed.
+      - Only the title column is decoded, lines not starting with a digit are skipped.
   """
-  return get_set(input_file, 1)
+  with open(input_file, 'rb') as f:
+    return frozenset(line.split(b'\t', 2)[1].rstrip(b'\n').decode('utf-8') for line in f if line[:1].isdigit())
+
 
-def get_set(input_file : str, idx : bool = 0, sep='\t'):
+def list_filenames(folder : str):
   """
-  Generic loader for two-column files.
+  Collect the names of the files stored directly inside a folder.
 
   Args:
-      input_file (str): Path to the file formatted as '{id}\t{title}.
-      idx (int): column selector (0 = id, 1 = title).
+      folder (str): Folder to list, subfolders are not entered.
 
   Return:
-      set[int] | set[str]: A set of ints (idx = 0) or a set of strings (idx = 1).
+      set[str]: Names of all files found.
 
   Notes:
-      - newlines are trimmed.
+      - Uses os.scandir, file types are taken from the directory entries so no stat() is needed per entry.
+      - Category names can contain '/', the files of such a subcategory live in a subfolder and are not listed.
+      - A missing folder yields an empty set.
   """
-  data = set()
-  with open(input_file, 'r', encoding='utf-8') as f:
-    for line in f:
-      columns = line.split(sep)
-
-      try:
-        id = int(columns[0])
-        title = str(columns[1])
-        tid = int(columns[2]) if len(columns) >= 3 else None
-      except ValueError:
-        continue
-
-      match idx:
-        case 0: 
-          data.add(id)
-        case 1: 
-          data.add(title.strip('\n'))
-        case 2: 
-          data.add(tid)
-  return data
-
+  try:
+    with os.scandir(folder) as it:
+      return {entry.name for entry in it if entry.is_file(follow_symlinks=False)}
+  except FileNotFoundError:
+    return set()
 
 def count_newlines_mmap(infile):
   try:
@@ -175,25 +387,48 @@ def count_newlines_mmap(infile):
   except Exception as e:
     return 0
   
-def get_progress_dl_categories(progress_file, phase_str  : str = 'download'):
-  categories = set()
-  try:
-    with progress_file.open('r', encoding='utf-8') as prog:
-      for line in prog:
-        if '=' not in line or not line.startswith(phase_str):
-          continue
+def save_found_totals(scanner_file : str, n_categories : int, n_files : int):
+  """
+  Store the size of the found files index in the progress journal.
 
-        key, value = line.split('=', 1)
-        key_split = key.split(':')
-        if len(key_split) > 2:
-          continue
-        
-        phase, cat = key_split
-        if not cat:
-          continue
+  Args:
+      scanner_file (str): Path to the progress/save file.
+      n_categories (int): Number of categories in the index.
+      n_files (int): Total number of files over all categories.
 
-        categories.add((cat, int(value)))
-  except:
-    pass
-  return categories
+  Return:
+      None
+  """
+  save_position(scanner_file, fformat('download', 'files', 'total', sep=':'), n_files)
+  save_position(scanner_file, fformat('download', 'categories', 'total', sep=':'), n_categories)
 
+def load_found_totals(scanner_file : str):
+  """
+  Read the size of the found files index from the progress journal.
+
+  Args:
+      scanner_file (str): Path to the progress/save file.
+
+  Return:
+      tuple[int, int]: The number of categories and files, (0, 0) if they were never saved.
+  """
+  positions = read_positions(scanner_file)[1]
+  return (positions.get(fformat('download', 'categories', 'total', sep=':'), 0),
+          positions.get(fformat('download', 'files', 'total', sep=':'), 0))
+
+def get_progress_dl_categories(progress_file, phase_str  : str = 'download'):
+  categories = {}
+  for key, value in read_positions(progress_file)[1].items():
+    if not key.startswith(phase_str):
+      continue
+
+    key_split = key.split(':')
+    if len(key_split) != 2:
+      continue
+    
+    phase, cat = key_split
+    if not cat:
+      continue
+
+    categories[cat] = value
+  return set(categories.items())
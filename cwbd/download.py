@@ -1,24 +1,40 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import requests
+from __future__ import annotations
+
+import shutil
+import time
+from itertools import islice
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 from .context import ProgramContext
-from .progress import PhaseProgressMonitor
 from .cwbd_utils import *
-from .rateLimiter import AdaptiveRateLimiter
 
-def download_file(session : requests.Session, rate : AdaptiveRateLimiter, out_dir : Path, file_title : str, max_retries  : int = 5):
+# requests (and urllib3/ssl) are only needed once downloading starts, importing them
+# lazily keeps `cwbd clean`, `cwbd status` and `cwbd fetch` startup cheap.
+if TYPE_CHECKING:
+  import requests
+  from .rateLimiter import AdaptiveRateLimiter
+
+DOWNLOAD_HEADERS = {
+  "User-Agent": "user@gmail.com",
+  "Referer": "https://commons.wikimedia.org/"
+}
+
+def download_file(session : requests.Session, rate : AdaptiveRateLimiter, out_dir : Path, file_title : str, max_retries  : int = 5,
+                  chunk_size : int = 256 * 1024):
   """
   Download a wikimedia commons file via Special:FilePath and save it to the ../imgs directory.
-  Skips download if the file already exists locally.
 
   Args:
-      ctx (ProgramContext): A class containing all settings, sets and filepaths for the program.
+      session (requests.Session): Shared HTTP session used for the request.
+      rate (AdaptiveRateLimiter): Rate limiter shared by all workers of the category.
+      out_dir (Path): Folder path where the file should be saved.
       file_title (str): Exact wikimedia filename including extension.
-      outfolder (str): Folder path where the file should be saved.
+      max_retries (int): Number of attempts on rate limiting or server errors.
+      chunk_size (int): Number of bytes copied to disk per read.
 
   Return:
-      None
+      tuple[str, bool]: The file title and wether it is available on disk.
 
   Notes:
       - Uses stream download to handle lage images efficiently.
@@ -27,31 +43,52 @@ def download_file(session : requests.Session, rate : AdaptiveRateLimiter, out_di
   url = f"https://commons.wikimedia.org/wiki/Special:FilePath/{file_title}"
   out_path = out_dir / file_title
 
-  for attempt in range(1, max_retries + 1):
-    rate.wait()
+  if out_path.exists():
+    return file_title, True
 
-    try:
-      r = session.get(url, stream=True, timeout=20)
+  # stream into a side file and only move it into place once it is complete, a file
+  # at out_path is then always a finished download, even after the process was killed.
+  part_path = out_path.with_name(out_path.name + '.part')
+  try:
+    out_file = open(part_path, "wb")
+  except OSError:
+    # e.g. a title too long for the filesystem, mark it failed instead of aborting the run
+    return file_title, False
 
-      if r.status_code == 200:
-        with open(out_path, "wb") as f:
-          for chunk in r.iter_content(2 * 1024 * 1024):
-            f.write(chunk)
+  completed = False
+  with out_file:
+    for attempt in range(1, max_retries + 1):
+      rate.wait()
 
-        rate.success()
-        return file_title, True
+      try:
+        r = session.get(url, stream=True, timeout=20)
 
-      elif r.status_code == 429:
-        retry_after = r.headers.get("Retry-After")
-        rate.backoff(retry_after if retry_after and retry_after.isdigit() else None)
-        continue
+        if r.status_code == 200:
+          # copy straight from the raw socket stream in C instead of looping over iter_content
+          r.raw.decode_content = True
+          shutil.copyfileobj(r.raw, out_file, chunk_size)
 
-      elif 500 <= r.status_code < 600:
-        rate.backoff()
-        continue
+          rate.success()
+          completed = True
+          break
 
-    except:
-      return file_title, False
+        elif r.status_code == 429:
+          retry_after = r.headers.get("Retry-After")
+          rate.backoff(retry_after if retry_after and retry_after.isdigit() else None)
+          continue
+
+        elif 500 <= r.status_code < 600:
+          rate.backoff()
+          continue
+
+      except:
+        break
+
+  if completed:
+    os.replace(part_path, out_path)
+    return file_title, True
+
+  part_path.unlink(missing_ok=True)
   return file_title, False
 
 
@@ -67,106 +104,164 @@ def download_media_files(pctx : ProgramContext):
   
   Notes: 
       - Created output folders for each category automatically.
-      - Skips files that are already downloaded.
+      - Skips files that are already downloaded, the category folder is listed once before submitting downloads.
+      - The download manifest pctx.downloaded_files is only appended to, skipping is decided by the category folder listing.
       - Track failed downloads in a dedicated file pctx.invalid_files.
       - Uses a ThreadPoolExecutor to perform paralell downloads based on pctx.max_workers.
   """
+  import requests
+  from requests.adapters import HTTPAdapter
+  from urllib3.util.retry import Retry
+  from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+  from .progress import PhaseProgressMonitor
+  from .rateLimiter import AdaptiveRateLimiter
+
   pctx.output_dir.mkdir(parents=True, exist_ok=True)
   phase_str = 'download'
 
+  # the manifest is only read to keep its lines unique, what gets downloaded is
+  # decided per category from the listing of its folder.
   try:
     pctx.downloads_set.update(pctx.downloaded_files.read_text(encoding='utf-8').splitlines())
+  except FileNotFoundError:
+    pass
+
+  try:
     pctx.failed_downloads_set.update(pctx.invalid_files.read_text(encoding='utf-8').splitlines())
   except FileNotFoundError:
     pass
 
-  file_map = get_json_data(pctx.found_files)
-  if not file_map:
+  # the index totals are saved when the index is written, only count them here when they
+  # are missing (index written by an older version) so the first download starts right away.
+  if (totals := load_found_totals(pctx.progress_scanner))[0] and pctx.found_files.exists():
+    n_categories, n_files = totals
+    file_map = load_found_files(pctx.found_files, count=False)[2]
+  else:
+    n_categories, n_files, file_map = load_found_files(pctx.found_files)
+    if n_categories:
+      save_found_totals(pctx.progress_scanner, n_categories, n_files)
+
+  if not n_categories:
     print('No downloadable files found! Run \'cwbd fetch\' first.')
     return
+
+  if pctx.rsearch:
+    is_selected = prefix_matcher(pctx.categories)
   else:
-    n_files = sum(int(entry['n_files']) for entry in file_map.values())
-    save_position(pctx.progress_scanner, fformat(phase_str, 'files', 'total', sep=':'), n_files)
+    is_selected = frozenset(pctx.categories).__contains__
 
-    n_categories = len(file_map)
-    save_position(pctx.progress_scanner, fformat(phase_str, 'categories', 'total', sep=':'), n_categories)
+  # replay the progress journal once, every category looks up its position in it
+  positions = read_positions(pctx.progress_scanner)[1]
 
-  completed_categories = get_progress_dl_categories(pctx.progress_scanner) # (cat, value)
+  # failed titles that turned up on disk during this run
+  recovered = set()
 
    
   #----------------------------
   # Category Loop
   #--------------------------------
 
-  for category, meta in file_map.items():
-    if pctx.rsearch:
-      if not any(category.startswith(c) for c in pctx.categories):
+  # One session and worker pool serve all categories, so keep-alive connections
+  # and threads are reused instead of being set up again for every category.
+  with requests.Session() as s, ThreadPoolExecutor(max_workers=pctx.max_workers) as executor:
+    s.headers.update(DOWNLOAD_HEADERS)
+    # Connection errors and timeouts are retried with backoff inside urllib3. HTTP status
+    # codes (429/5xx) are left to download_file so they keep driving the shared rate limiter.
+    retries = Retry(total=5, backoff_factor=1.0, status_forcelist=(), allowed_methods=("GET",))
+    # Special:FilePath redirects to upload.wikimedia.org, so only two hosts are ever
+    # contacted, each needs a pool large enough to keep one connection per worker alive.
+    s.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=pctx.max_workers, max_retries=retries))
+
+    for category, meta in file_map:
+      if not is_selected(category):
         continue
-    else:
-      if category not in pctx.categories:
+
+      if not (files := meta.get("files", [])):
+        continue
+
+      progress_key = fformat(phase_str, category, sep=':')
+      total = len(files)
+      if positions.get(progress_key, 0) >= total:
         continue
-    
-    if (category, meta['n_files']) in completed_categories:
-      continue
-
-    if not (files := meta.get("files", [])):
-      continue
-
-    out_dir : Path = pctx.output_dir / category
-    out_dir.mkdir(parents=True, exist_ok=True)
-
-    start = load_position(pctx.progress_scanner, 
-                          fformat(phase_str, category, sep=':'))
-    total = len(files) if len(files) < 100 else 100 # arbitrary number to prevent downloadign thousands for all categories... could do a proportinate amount? or cli arg?
-    if start >= total:
-      continue
-    
-    # otherwise these get skipped during existance check
-    # This is mostly a fix for an issues when the user exits the program before the 
-    # category is finished downloading all files...
-    pctx.downloads_set.update(files[:start])
-
-    files = files[start:total]
-    if not files:
-      continue
-    
-    rate_limiter = AdaptiveRateLimiter()
-
-    # Setup tracker
-    tracker = PhaseProgressMonitor(total, category, pctx.downloaded_files) # maybe we need to check Entries: 
-    tracker._current = start
-
-    with requests.Session() as s:
-      s.headers.update({
-        "User-Agent": "user@gmail.com",
-        "Referer": "https://commons.wikimedia.org/"
-      })
-
-      with ThreadPoolExecutor(max_workers=pctx.max_workers) as executor:
-        futures = {
-          executor.submit(download_file, s, rate_limiter, out_dir, f): f for f in files
-        }
-
-        for f in as_completed(futures):
+
+      out_dir : Path = pctx.output_dir / category
+      out_dir.mkdir(parents=True, exist_ok=True)
+
+      new_downloads = []
+      new_failed = []
+
+      # list the category folder once and settle everything that is already on disk up front,
+      # only what is left is submitted to the pool. The saved position counts finished titles,
+      # it is not a prefix of files, so every title is checked against the listing on resume.
+      # The manifest holds bare titles, a title shared with an earlier category is not in this
+      # folder yet, and earlier failures are retried.
+      on_disk = list_filenames(out_dir)
+      settled = 0
+      todo = []
+      for file_title in files:
+        if file_title in on_disk:
+          if file_title not in pctx.downloads_set:
+            pctx.downloads_set.add(file_title)
+            new_downloads.append(file_title)
+          if file_title in pctx.failed_downloads_set:
+            recovered.add(file_title)
+          settled += 1
+        else:
+          todo.append(file_title)
+      # each title gets its own .part file, so a title listed twice must not be in flight twice
+      files = list(dict.fromkeys(todo))
+      
+      rate_limiter = AdaptiveRateLimiter(concurrency=pctx.max_workers)
+
+      # Setup tracker
+      tracker = PhaseProgressMonitor(total, category, pctx.downloaded_files) # maybe we need to check Entries: 
+      tracker._current = settled
+      last_flush = time.monotonic()
+
+      # Keep a bounded window of submitted downloads, so pending futures stay
+      # O(max_workers) instead of O(files) for huge categories.
+      pending = iter(files)
+      in_flight = {
+        executor.submit(download_file, s, rate_limiter, out_dir, f, chunk_size=pctx.chunk_size) for f in islice(pending, 2 * pctx.max_workers)
+      }
+
+      while in_flight:
+        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+        for f in islice(pending, len(done)):
+          in_flight.add(executor.submit(download_file, s, rate_limiter, out_dir, f, chunk_size=pctx.chunk_size))
+
+        for f in done:
           file_title, succes = f.result()
 
           if succes:
-            pctx.downloads_set.add(file_title)
+            if file_title not in pctx.downloads_set:
+              pctx.downloads_set.add(file_title)
+              new_downloads.append(file_title)
+            if file_title in pctx.failed_downloads_set:
+              recovered.add(file_title)
             tracker._current += 1
 
-            save_position(pctx.progress_scanner, 
-                          fformat(phase_str, category, sep=':'),
-                          tracker._current)
+            # coalesce progress updates, at most one progress file rewrite per flush_interval
+            if (now := time.monotonic()) - last_flush >= pctx.flush_interval:
+              save_position(pctx.progress_scanner, progress_key, tracker._current)
+              last_flush = now
               
           else:
-            pctx.failed_downloads_set.add(file_title)
+            recovered.discard(file_title)
+            if file_title not in pctx.failed_downloads_set:
+              pctx.failed_downloads_set.add(file_title)
+              new_failed.append(file_title)
   
       tracker.finish()          
+      save_position(pctx.progress_scanner, progress_key, tracker._current)
 
-    pctx.downloaded_files.write_text(
-      '\n'.join(pctx.downloads_set), encoding='utf-8'
-    )
+      # only append what this category added, rewriting the full sets grows with every category
+      append_lines(pctx.downloaded_files, new_downloads)
+      append_lines(pctx.invalid_files, new_failed)
 
-    pctx.invalid_files.write_text(
-      '\n'.join(pctx.failed_downloads_set), encoding='utf-8'
-    )
+  # the failure journal is only ever appended to, drop titles that this run found on disk
+  # or downloaded since (e.g. placed in the output directory by hand) once per run.
+  if recovered:
+    pctx.failed_downloads_set -= recovered
+    atomic_write(pctx.invalid_files, ''.join(fformat(f, newline=True) for f in pctx.failed_downloads_set).encode('utf-8'))
@@ -1,10 +1,9 @@
-import json
 import shutil
 from pathlib import Path
 
 from .cli import get_cli_input
 from .cwbd_utils import *
-from .scanner import scan_commons_db, get_parser, PHASE_TOTALS
+from .scanner import scan_commons_db, progress_keys, PHASE_TOTALS
 from .download import download_media_files
 from .context import ProgramContext
 
@@ -77,18 +76,14 @@ def retrace(ctx : ProgramContext):
   """
   pfiles = ctx.program_files
   ordered_downloads = dict()
-  lt_id_to_title = {}
-  
+
+  # plain dict comprehensions over the (already filtered) scan outputs, the split is
+  # done once per line and every lookup below is a single dict.get().
   with open(pfiles[ctx.linktarget_dump], 'r', encoding='utf-8') as link:
-    for line in link:
-      id, title = line.rstrip('\n').split('\t', 1)
-      lt_id_to_title[int(id)] = title
+    lt_id_to_title = {int(id): title for id, _, title in (line.rstrip('\n').partition('\t') for line in link)}
 
-  page_id_to_file = {}
   with open(pfiles[ctx.page_dump], 'r', encoding='utf-8') as page:
-    for line in page:
-      id, title = line.rstrip('\n').split('\t', 1)
-      page_id_to_file[int(id)] = title
+    page_id_to_file = {int(id): title for id, _, title in (line.rstrip('\n').partition('\t') for line in page)}
 
   with open(pfiles[ctx.category_dump], 'r', encoding='utf-8') as cl:
     for line in cl:
@@ -96,25 +91,24 @@ def retrace(ctx : ProgramContext):
       id, _, tid = line.split('\t')
       
       id = int(id)
-      tid = int(tid)
-
-      if id not in page_id_to_file:
+      if (file := page_id_to_file.get(id)) is None:
         continue
 
-      title = lt_id_to_title.get(tid)
+      title = lt_id_to_title.get(int(tid))
       if not title:
         continue
       
-      if title not in ordered_downloads:
-        ordered_downloads[title] = {
-          'id' : int(id),
+      if (entry := ordered_downloads.get(title)) is None:
+        entry = ordered_downloads[title] = {
+          'id' : id,
           'n_files' : 0,
           'files' : [],
         }
 
-      entry = ordered_downloads[title]
-      entry['files'].append(page_id_to_file[id])
-      entry['n_files'] += 1
+      entry['files'].append(file)
+
+  for entry in ordered_downloads.values():
+    entry['n_files'] = len(entry['files'])
 
   return ordered_downloads
 
@@ -127,14 +121,13 @@ def update_found_files(json_file : Path, data: dict):
         data (dict): Dictionary of newly found media files (output from retrace)
 
     Returns:
-        None
+        tuple[int, int]: The number of categories and files in the updated index.
 
     Notes:
         - Merges new files with existing entries, avoiding duplicates
   """
   if json_file.exists():
-    with json_file.open('r', encoding='utf-8') as f:
-      existing = json.load(f)
+    existing = read_json_data(json_file)
   else:
       existing = {}
   
@@ -151,12 +144,15 @@ def update_found_files(json_file : Path, data: dict):
       existing[cat]['files'].extend(new_files)
       existing[cat]['n_files'] = len(existing[cat]['files'])
 
-  with json_file.open('w', encoding='utf-8') as f:
-    json.dump(existing, f, indent=2, ensure_ascii=False)
+  write_json_data(json_file, existing)
+  return len(existing), sum(meta['n_files'] for meta in existing.values())
 
 def load_normalized_categories_from_file(infile : str):
-  with open(infile, 'r', encoding='utf-8') as f:
-    return set(normalize(norm_title) for norm_title in f.read().splitlines() if norm_title.strip())
+  try:
+    with open(infile, 'r', encoding='utf-8') as f:
+      return set(normalize(norm_title) for norm_title in f.read().splitlines() if norm_title.strip())
+  except FileNotFoundError:
+    raise SystemExit(f'[ERROR] File does not exist: {infile}')
 
 def clean_program_files():
   """
@@ -228,9 +224,8 @@ def print_program_status():
       total_end = load_position(ctx.progress_scanner, formatted_size_str)
 
       read_lines = 0
-      if (parser := get_parser(phase_str)):
-        formatted_prog_str = fformat(phase_str, parser['handler'].func.__name__, ctx.save_interval, sep=':')
-        read_lines = load_position(ctx.progress_scanner, formatted_prog_str)
+      if (keys := progress_keys(phase_str, ctx.save_interval)):
+        read_lines = load_position(ctx.progress_scanner, keys[0])
       else:
           PHASE_TOTALS[phase_str] = load_position(ctx.progress_scanner, fformat(phase_str, 'files', 'total', sep=':'))
           n_categories = load_position(ctx.progress_scanner, fformat(phase_str, 'categories', 'total', sep=':'))
@@ -306,14 +301,14 @@ def main():
       pctx.process_categories = pctx.categories - set(get_json_data(pctx.found_files))
       if pctx.process_categories:
         find_media_file_titles(pctx)
-        update_found_files(pctx.found_files, retrace(pctx))
+        save_found_totals(pctx.progress_scanner, *update_found_files(pctx.found_files, retrace(pctx)))
     
     case 'download':
       pctx = ProgramContext.init_download(
         output_dir=Path(args.output_dir),
         input_categories=load_normalized_categories_from_file(args.category_file),
         max_workers=args.workers,
-        recursive_search=args.recursive_search
+        recursive_search=args.recursive_search,
       )
           
       download_media_files(pctx)
@@ -330,7 +325,7 @@ def main():
       pctx.process_categories = pctx.categories - set(get_json_data(pctx.found_files))
       if pctx.process_categories:
         find_media_file_titles(pctx)
-        update_found_files(pctx.found_files, retrace(pctx))
+        save_found_totals(pctx.progress_scanner, *update_found_files(pctx.found_files, retrace(pctx)))
 
       download_media_files(pctx)
 
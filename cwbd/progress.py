@@ -1,6 +1,6 @@
 import time
 import sys
-import mmap
+import os
 import threading
 
 class PhaseProgressMonitor(threading.Thread):
@@ -15,27 +15,39 @@ class PhaseProgressMonitor(threading.Thread):
     self.last_update = 0
     self.last_matches_update = 0
 
-    self.update_interval = .05
+    self.update_interval = .25
     self.match_interval = 1
+
+    # redraw early once this many lines were processed since the last print
+    self.update_step = max(1, total // 1000) if total else 1
+    self._printed = (0, 0)
+
+    # without a terminal the cursor can't be moved, only the final state is printed
+    self._tty = sys.stdout.isatty()
     
-    self._stop = False
+    self._stopped = False
     self.phase = phase
     
     self._current = 0
     self._matches = 0
 
+    # tail position of the progress file, only bytes past it are counted each tick
+    self._last_pos = 0
+    self._last_count = 0
+
     self._start()
 
   def run(self):
-    while not self._stop:
+    while not self._stopped:
       now = time.time()
 
       if self.progress_file and now - self.last_matches_update >= self.match_interval:
-        self._matches = self.count_newlines_mmap()
+        self._matches = self.count_newlines()
         self.last_matches_update = now
 
-      if self._current or self._matches:
-        if now - self.last_update >= self.update_interval:
+      if self._tty and (self._current, self._matches) != self._printed:
+        if (now - self.last_update >= self.update_interval
+            or self._current - self._printed[0] >= self.update_step):
           self.update()
           self.last_update = now
 
@@ -46,13 +58,22 @@ class PhaseProgressMonitor(threading.Thread):
     sys.stdout.flush()
     self.start()
 
-  def count_newlines_mmap(self):
+  def count_newlines(self):
     try:
       with open(self.progress_file , "rb") as f:
-        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
-          return mm[:].count(b"\n")
+        # the file was truncated or replaced, start counting from the top again
+        if os.fstat(f.fileno()).st_size < self._last_pos:
+          self._last_pos = 0
+          self._last_count = 0
+
+        f.seek(self._last_pos)
+        buf = f.read()
     except:
-      return 0
+      return self._last_count
+
+    self._last_count += buf.count(b"\n")
+    self._last_pos += len(buf)
+    return self._last_count
     
   def update(self):
     elapsed = time.time() - self.start_time
@@ -74,18 +95,19 @@ class PhaseProgressMonitor(threading.Thread):
     phase_line = phase_line.ljust(terminal_width)
 
     # If this is not the first print, move cursor up 2 lines to overwrite previous
-    if getattr(self, "_printed_once", False):
+    if self._tty and getattr(self, "_printed_once", False):
         sys.stdout.write("\033[F\033[F")  # move cursor up 2 lines
 
     sys.stdout.write(progress_line + "\n" + phase_line + "\n")
     sys.stdout.flush()
 
     self._printed_once = True
+    self._printed = (self._current, self._matches)
 
 
   def finish(self):
     self.update()
-    self._stop = True
+    self._stopped = True
     self.join()
     sys.stdout.write(f"[INFO] Phase '{self.phase}' Completed!\n")
     sys.stdout.flush()
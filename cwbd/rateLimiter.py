@@ -2,12 +2,14 @@ import threading
 import time
 
 class AdaptiveRateLimiter:
-  def __init__(self, base : float = 1.0, max  : float= 60.0, factor : float= 2.0):
+  def __init__(self, base : float = 1.0, max  : float= 60.0, factor : float= 2.0, concurrency : int = 1):
     self.base = base
     self.max = max
     self.factor = factor
+    self.concurrency = concurrency
 
     self._delay = base
+    self._next_slot = 0.0
     self._lock = threading.Lock()
     self._pause = threading.Event()
     self._pause.set()
@@ -16,7 +18,17 @@ class AdaptiveRateLimiter:
 
   def wait(self):
     self._pause.wait()
-    time.sleep(self._delay)
+
+    # hand out request slots from one shared monotonic deadline, spaced so all
+    # workers together still make `concurrency` requests per `_delay` seconds.
+    # only the slot allocation is serialized, the sleep happens outside the lock.
+    with self._lock:
+      now = time.monotonic()
+      wait_for = max(0.0, self._next_slot - now)
+      self._next_slot = max(now, self._next_slot) + self._delay / self.concurrency
+
+    if wait_for:
+      time.sleep(wait_for)
 
   def success(self):
     with self._lock:
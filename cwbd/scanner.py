@@ -1,6 +1,14 @@
-import gzip
+import io
 import re
-from functools import partial
+import queue
+import threading
+from itertools import islice
+from functools import lru_cache
+
+try:
+  from isal import igzip as gzip
+except ImportError:
+  import gzip
 
 from .cwbd_utils import *
 from .context import ProgramContext
@@ -13,6 +21,99 @@ PHASE_TOTALS = {
   "categorylinks": 123406,
   "page": 24450,
 }
+
+# read buffer in front of the decompressor, the dumps are read strictly sequential
+READ_BUFFER_SIZE = 4 * 1024 * 1024
+
+# write buffer of the scan output, it is flushed whenever a position is saved
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+def open_dump(infile : str):
+  """
+  Open a compressed SQL dump for reading raw lines.
+
+  Args:
+      infile (str): Path to the compressed '.sql.gz' dump file.
+
+  Return:
+      io.BufferedReader: The decompressed dump, lines are bytes and not decoded.
+
+  Notes:
+      - Uses the ISA-L based isal.igzip decompressor when it is installed, gzip otherwise.
+      - Decompression runs ahead on a background thread, see PrefetchReader.
+      - The kernel is told the dump is read sequentially (where supported) for a larger read-ahead.
+  """
+  dump = gzip.open(infile, 'rb')
+  if hasattr(os, 'posix_fadvise'):
+    os.posix_fadvise(dump.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+  return io.BufferedReader(PrefetchReader(dump), buffer_size=READ_BUFFER_SIZE)
+
+class PrefetchReader(io.RawIOBase):
+  """
+  Raw reader that reads a stream ahead on a background thread.
+
+  The phases depend on each other's output, so they can't be scanned in parallel. Within a
+  phase inflate (which releases the GIL) overlaps with matching the previously read lines.
+
+  Args:
+      raw: The stream to read from, closed together with the reader.
+      chunk_size (int): Number of bytes read from the stream at a time.
+      depth (int): Number of chunks that are read ahead.
+  """
+  def __init__(self, raw, chunk_size : int = READ_BUFFER_SIZE, depth : int = 4):
+    super().__init__()
+    self._raw = raw
+    self._chunks = queue.Queue(depth)
+    self._stopped = threading.Event()
+    self._error = None
+    self._eof = False
+    self._view = memoryview(b'')
+
+    self._thread = threading.Thread(target=self._fill, args=(chunk_size,), daemon=True)
+    self._thread.start()
+
+  def _fill(self, chunk_size : int):
+    try:
+      while not self._stopped.is_set() and (chunk := self._raw.read(chunk_size)):
+        self._chunks.put(chunk)
+    except BaseException as e:
+      self._error = e
+    finally:
+      # an empty chunk marks the end of the stream
+      self._chunks.put(b'')
+
+  def readable(self):
+    return True
+
+  def readinto(self, buffer):
+    if not self._view:
+      if self._eof:
+        return 0
+
+      self._view = memoryview(self._chunks.get())
+      if not self._view:
+        self._eof = True
+        if self._error:
+          raise self._error
+        return 0
+
+    n = min(len(buffer), len(self._view))
+    buffer[:n] = self._view[:n]
+    self._view = self._view[n:]
+    return n
+
+  def close(self):
+    if not self.closed:
+      # the reader may stop early (match cap), unblock the thread so it can see the stop
+      self._stopped.set()
+      while self._thread.is_alive():
+        try:
+          self._chunks.get(timeout=0.1)
+        except queue.Empty:
+          pass
+      self._raw.close()
+    super().close()
     
 def scan_commons_db(infile : str, outfile : str, pctx : ProgramContext):
   """
@@ -29,22 +130,49 @@ def scan_commons_db(infile : str, outfile : str, pctx : ProgramContext):
 
   Notes:
       - Supports incremental scanning using a simple key=value progress file.
-      - Uses TABLE_PARSER_PATTERN to determinehandler + regex per table.
+      - Uses TABLE_PARSERS to determine handler + regex per table.
       - Only lines containing "INSERT INTO '{table}' are processed.
       - Handles extremely large SQL dumps without re-scanning completed parts.
   """
-  db_entry = str(infile).split(".", 1)[0].split("-")[-1]
+  db_entry = dump_table_name(infile)
   parser = get_parser(db_entry, pctx)
   scanfile = pctx.progress_scanner
 
   # if use_checkpoints:
-  formatted_prog_str = fformat(db_entry, parser['handler'].func.__name__, pctx.save_interval, sep=':')
-  formatted_size_str = fformat(db_entry, sep=':')
-    
-  start = load_position(scanfile, formatted_prog_str)
-  end = load_position(scanfile, formatted_size_str)
+  formatted_prog_str, formatted_size_str, formatted_count_str, formatted_offset_str = progress_keys(db_entry, pctx.save_interval)
+
+  positions = read_positions(scanfile)[1]
+  start = positions.get(formatted_prog_str, 0)
+  end = positions.get(formatted_size_str, 0)
+
+  # the match count is journaled with the positions, only progress files written by
+  # older versions have no count key and fall back to counting the output file
+  if (found_matches := positions.get(formatted_count_str)) is None:
+    found_matches = count_newlines_mmap(outfile)
+
+  # rows written after the last saved position are flushed on exit too, the resumed scan
+  # emits them again. The count and output size are journaled together with the position,
+  # without a position all output is from an interrupted first stretch of the scan.
+  offset = None
+  if not start:
+    found_matches, offset = 0, 0
+  elif not end or start < end:
+    offset = positions.get(formatted_offset_str)
+  if offset is not None:
+    try:
+      with open(outfile, "rb") as f:
+        f.seek(offset)
+        tail = f.read()
+    except FileNotFoundError:
+      tail = b""
+
+    # the capped rows of the saved line are kept past the offset, a capped phase is done
+    if pctx.max_phase_matches and found_matches + tail.count(b"\n") >= pctx.max_phase_matches:
+      return
+
+    if tail:
+      os.truncate(outfile, offset)
 
-  found_matches = count_newlines_mmap(outfile) # load from file
   if pctx.max_phase_matches and found_matches >= pctx.max_phase_matches:
     return
 
@@ -53,30 +181,59 @@ def scan_commons_db(infile : str, outfile : str, pctx : ProgramContext):
   if not end or start < end:
     
     tracker = PhaseProgressMonitor(PHASE_TOTALS[db_entry], db_entry, outfile)
-    
-    with gzip.open(infile, 'rt', encoding='utf-8', errors='ignore') as inf,\
-      open(outfile, "a", encoding="utf-8", errors='ignore') as outf:
 
-      for line in inf:
+    # lines are matched as raw bytes, handlers only decode the fields of accepted rows.
+    # mysqldump starts every INSERT statement on its own line, so only the prefix is tested.
+    needle = f"INSERT INTO `{db_entry}`".encode('utf-8')
+
+    # bind everything the loop touches to locals once, the loop runs for every dump line
+    save_interval = pctx.save_interval
+    max_matches = pctx.max_phase_matches
+    finditer = parser['regex'].finditer
+    handler = parser['handler']
+
+    # newline='' keeps '\n' line endings on every platform, the id/title loaders split on b'\n'
+    with open_dump(infile) as inf,\
+      open(outfile, "a", encoding="utf-8", errors='ignore', newline='', buffering=WRITE_BUFFER_SIZE) as outf:
+      write = outf.write
+
+      # skip to the resume position in C, the saved line itself is scanned again
+      lines = inf
+      if start > 1:
+        lines = islice(inf, start - 1, None)
+        lc = start - 1
+
+      for raw in lines:
         lc += 1
         tracker._current = lc
 
-        if f"INSERT INTO `{db_entry}`" not in line or lc < start:
+        if not raw.startswith(needle):
           continue
         
-        if lc % pctx.save_interval == 0:
-          save_position(scanfile, formatted_prog_str, lc)
+        # flush before saving, a saved position never points past unwritten matches
+        if lc % save_interval == 0:
           outf.flush()
+          save_position(scanfile, formatted_prog_str, lc)
+          save_position(scanfile, formatted_count_str, found_matches)
+          save_position(scanfile, formatted_offset_str, outf.tell())
 
-        if (matches := extract_match(line, parser)):
-          for match in matches:
-            outf.write(fformat(match, newline=True))
-            save_position(scanfile, formatted_prog_str, lc)
+        if not (rows := [row for m in finditer(raw) if (row := handler(m.groups()))]):
+          continue
 
-            found_matches += 1
-            if pctx.max_phase_matches and found_matches >= pctx.max_phase_matches:
-              tracker.finish()
-              return
+        # one write per line, positions are only saved on the interval above
+        if max_matches and found_matches + len(rows) >= max_matches:
+          # the saved line is scanned again on resume (e.g. by a later recursive search),
+          # so journal the count and size from before its rows are written.
+          outf.flush()
+          save_position(scanfile, formatted_prog_str, lc)
+          save_position(scanfile, formatted_count_str, found_matches)
+          save_position(scanfile, formatted_offset_str, outf.tell())
+          write('\n'.join(rows[:max_matches - found_matches]) + '\n')
+          tracker.finish()
+          return
+
+        write('\n'.join(rows) + '\n')
+        found_matches += len(rows)
     tracker.finish()
   else:
     lc = start
@@ -84,170 +241,185 @@ def scan_commons_db(infile : str, outfile : str, pctx : ProgramContext):
   # save final linecount to prevent recalculation, since these are huge files. 
   save_position(scanfile, formatted_prog_str, lc)
   save_position(scanfile, formatted_size_str, lc)
+  save_position(scanfile, formatted_count_str, found_matches)
 
 
-def extract_match(line : str, pp : dict):
-  """
-  Extract regex matches from a SQL INSERT line and pass results to a parser
-  
-  Args:
-      line (str): A line from the SQL dump.
-      pp (dict): A pattern/handler dictionary with:
-          - 'regex': compiled regex used to find matches
-          - 'handler': function to process each match
-
-  Return:
-      List: A list of processed match results (filtered by handler)
+def lt_handler(ctx : ProgramContext):
   """
-  matches = []
-  # TODO: explore options using iter instead of findall for memory purposes.
-  for m in pp['regex'].findall(line):
-    if (res := pp['handler'](m)):
-      matches.append(res)
-  return matches
-
-def lt_handler(ctx : ProgramContext, match : tuple):
-  """
-  Parse a row from the 'linktarget' dump.
+  Build the row parser for the 'linktarget' dump.
 
   Args:
       ctx (ProgramContext): A class containing all settings, sets and filepaths for the program.
-      match (tuple): Regex captured fields.
 
   Return:
-      str | None: Formatted '{id}\t{title}' if valid, otherwise None
+      Callable[[tuple[bytes]], str | None]: Parser of the regex captured fields, returns
+                                            the formatted '{id}\t{title}' if valid, otherwise None
 
   Notes:
-      - Only accepts categories starting with 'Taken_wih_'
-      - Backslashes are removed for safe output
+      - Only accepts categories equal to (or with recursive search starting with) an input category
+      - The categories are bound once, the parser is built per scan by get_parser
   """
-  id, ns, title = match
-  
-  try:
-    id = int(id)
-    ns = int(ns)
-  except ValueError:
-    return
-  
-  if ns == WikiNamespace.CATEGORY:
-    for cat in ctx.process_categories:
-      if ctx.rsearch:
-        if title.startswith(cat):
-          return fformat(id, title)
-      else:
-        if title == cat:
-          return fformat(id, title)
-  return None
+  categories = frozenset(ctx.process_categories)
+  is_selected = prefix_matcher(categories) if ctx.rsearch else categories.__contains__
+  category_ns = WikiNamespace.CATEGORY
+
+  def parse(match):
+    id, ns, title = match
+    
+    try:
+      if int(ns) != category_ns:
+        return None
+      id = int(id)
+    except ValueError:
+      return None
+    
+    title = title.decode('utf-8', 'ignore')
+    if is_selected(title):
+      return fformat(id, title)
+    return None
+  return parse
       
-def cl_handler(ctx : ProgramContext, match):
+def cl_handler(ctx : ProgramContext):
   """
-  Parse a row from the 'CategoryLinks' dump.
+  Build the row parser for the 'CategoryLinks' dump.
 
   Args:
       ctx (ProgramContext): A class containing all settings, sets and filepaths for the program.
-      match (tuple): Regex captured fields.
 
   Return:
-      str | None: Formatted '{from}\t{sortkey}' if valid, otherwise None
+      Callable[[tuple[bytes]], str | None]: Parser of the regex captured fields, returns
+                                            the formatted '{from}\t{sortkey}\t{target_id}' if valid, otherwise None
 
   Notes:
-      - Only accepts rows of type 'file'
-      - target_id must appear in LT_ID_SET to qualify 
+      - Only rows of type 'file' without a sortkey prefix are matched by CATEGORYLINKS_REGEX
+      - target_id must appear in LT_ID_SET (ctx.program_set) to qualify 
   """
-  _from, sortkey, _, sortkey_prefix, type, _, target_id = match
-  try:
-    _from = int(_from)
-    target_id = int(target_id)
-  except ValueError:
-    return None
-  
-  if CONTROL_CHARS.search(sortkey):
-    return None
-  
-  if type == 'file':
-    if target_id in ctx.program_set:
-      if not sortkey_prefix:
-        return fformat(_from, sortkey, target_id)
-  return None
+  program_set = ctx.program_set
+  has_control_chars = CONTROL_CHARS.search
+
+  def parse(match):
+    _from, sortkey, target_id = match
+
+    try:
+      target_id = int(target_id)
+      if target_id not in program_set:
+        return None
+      _from = int(_from)
+    except ValueError:
+      return None
+    
+    if has_control_chars(sortkey):
+      return None
+    
+    return fformat(_from, sortkey.decode('utf-8', 'ignore'), target_id)
+  return parse
 
-def page_handler(ctx : ProgramContext, match):
+def page_handler(ctx : ProgramContext):
   """
-  Parse a row from the 'Pages' dump.
+  Build the row parser for the 'Pages' dump.
 
   Args:
       ctx (ProgramContext): A class containing all settings, sets and filepaths for the program.
-      match (tuple): Regex captured fields.
 
   Return:
-      str | None: Formatted '{id}\t{title}' if valid, otherwise None
+      Callable[[tuple[bytes]], str | None]: Parser of the regex captured fields, returns
+                                            the formatted '{id}\t{title}' if valid, otherwise None
 
   Notes:
       - Only entries with namespace FILE (6) are considered
-      - Id must appear in CL_ID_SET to qualify 
+      - Id must appear in CL_ID_SET (ctx.program_set) to qualify 
   """
-  id, ns, title = match
-    
-  try:
-    id = int(id)
-    ns = int(ns) 
-  except ValueError:
-    return
-  
-  if id in ctx.program_set:
-    if ns == WikiNamespace.FILE:
-      if os.path.splitext(title)[1].lower() in ('.jpg', '.jpeg'):
-        return fformat(id, title)
-      
+  program_set = ctx.program_set
+  file_ns = WikiNamespace.FILE
 
-
-
-CONTROL_CHARS = re.compile(r'[\x00-\x1F\x7F]')
+  def parse(match):
+    id, ns, title = match
+      
+    try:
+      id = int(id)
+      if id not in program_set or int(ns) != file_ns:
+        return None
+    except ValueError:
+      return None
+    
+    # only the last five bytes are lowered, the title is decoded once it is a jpeg
+    if not title[-5:].lower().endswith((b'.jpg', b'.jpeg')):
+      return None
+    return fformat(id, title.decode('utf-8', 'ignore'))
+  return parse
+
+CONTROL_CHARS = re.compile(rb'[\x00-\x1F\x7F]')
+
+# possessive quantifiers (Python 3.11+) never give back what they consumed, a row that
+# does not fit fails right away instead of backtracking through its fields.
+# only 'file' rows without a sortkey prefix are of interest, the fixed fields reject all
+# other rows inside the regex engine and only the three used fields are captured.
 CATEGORYLINKS_REGEX = re.compile(
-  r'\('
-  r'(\d+),'                  # From           : int
-  r"'([^']*)',"              # Sortkey        : string
-  r"'([^']*)',"              # Timestamp      : str
-  r"'([^']*)',"              # Sortkey_prefix : str
-  r"'(page|subcat|file)',"   # Type           : enum
-  r'(\d+),'                  # Collation_id   : int
-  r'(\d+)'                   # Target_id      : int
-  r'\)'
+  rb'\('
+  rb'(\d++),'                 # From           : int
+  rb"'([^']*+)',"             # Sortkey        : string
+  rb"'[^']*+',"               # Timestamp      : str
+  rb"'',"                     # Sortkey_prefix : str (empty)
+  rb"'file',"                 # Type           : enum
+  rb'\d++,'                   # Collation_id   : int
+  rb'(\d++)'                  # Target_id      : int
+  rb'\)'
 )
 
 PAGE_REGEX = re.compile(
-  r"\("
-  r"(\d+),"               # ID        : int
-  r"(-?\d+),"             # Namespace : int (can be negative)
-  r"'([^']*)'"            # Title     : str
-  r"(?:,.*?)*"            # Ignore all remaining fields
-  r"\)"
+  rb"\("
+  rb"(\d++),"              # ID        : int
+  rb"(-?\d++),"            # Namespace : int (can be negative)
+  rb"'([^']*+)'"           # Title     : str
+  rb"(?:,[^)]*+)?"         # Ignore all remaining fields
+  rb"\)"
 )
 
 LINKTARGET_REGEX =  re.compile(
-  r'\('
-  r'(\d+),'                 # ID        : int 
-  r'(-?\d+),'               # Namespace : int (can be negative)
-  r"'(.*?)'"                # Title     : str
-  r'\)'
+  rb'\('
+  rb'(\d++),'                # ID        : int 
+  rb'(-?\d++),'              # Namespace : int (can be negative)
+  rb"'(.*?)'"                # Title     : str
+  rb'\)'
 )
 
-def get_parser(id_str : str, ctx : ProgramContext = None):
-  match id_str:
-    case 'linktarget': 
-      return {
-        'regex' : LINKTARGET_REGEX, 
-        'handler' : partial(lt_handler, ctx)
-      }
-    case 'categorylinks':
-      return  {
-        'regex' : CATEGORYLINKS_REGEX, 
-        'handler' : partial(cl_handler, ctx)
-      }    
-    case 'page':
-      return  {
-        'regex' : PAGE_REGEX, 
-        'handler' : partial(page_handler, ctx)
-      }
-  
+# dump table -> (row regex, row parser factory), the factory name is part of the progress keys
+TABLE_PARSERS = {
+  'linktarget'    : (LINKTARGET_REGEX, lt_handler),
+  'categorylinks' : (CATEGORYLINKS_REGEX, cl_handler),
+  'page'          : (PAGE_REGEX, page_handler),
+}
+
+def get_parser(id_str : str, ctx : ProgramContext):
   # not a valid db entry
-  return None
\ No newline at end of file
+  if (parser := TABLE_PARSERS.get(id_str)) is None:
+    return None
+
+  regex, make_handler = parser
+  return {
+    'regex' : regex,
+    'handler' : make_handler(ctx)
+  }
+
+@lru_cache(maxsize=None)
+def progress_keys(id_str : str, save_interval : int):
+  """
+  Build the progress journal keys of a scan phase.
+
+  Args:
+      id_str (str): The dump table of the phase.
+      save_interval (int): Number of lines between saved positions.
+
+  Return:
+      tuple[str, str, str, str] | None: The keys of the scan position, the total line count, the match
+                                        count and the output size, None for a phase that is not a dump scan.
+  """
+  if (parser := TABLE_PARSERS.get(id_str)) is None:
+    return None
+  
+  return (
+    fformat(id_str, parser[1].__name__, save_interval, sep=':'),
+    fformat(id_str, sep=':'),
+    fformat(id_str, 'matches', sep=':'),
+    fformat(id_str, 'offset', sep=':'),
+  )
@@ -9,6 +9,9 @@ setup(
   author='Jort de Boer',
   packages=find_packages(),
   install_requires=['requests'],
+  extras_require={
+    'speedups': ['ijson', 'orjson', 'isal'],
+  },
   entry_points={
     'console_scripts': [
       'cwbd=cwbd.main:main'